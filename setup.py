@@ -1,6 +1,8 @@
 import io
+import os
 import re
 
+from setuptools import Extension
 from setuptools import find_packages
 from setuptools import setup
 
@@ -10,6 +12,17 @@ with io.open("README.rst", "rt", encoding="utf8") as f:
 with io.open("src/werkzeug/__init__.py", "rt", encoding="utf8") as f:
     version = re.search(r'__version__ = "(.*?)"', f.read(), re.M).group(1)
 
+ext_modules = []
+
+# The compiled speedups for the form parser are optional and only built
+# on request, the pure Python implementation is used otherwise.
+if os.environ.get("WERKZEUG_BUILD_EXT"):
+    from Cython.Build import cythonize
+
+    ext_modules = cythonize(
+        [Extension("werkzeug._formparser_fast", ["src/werkzeug/_formparser_fast.pyx"])]
+    )
+
 setup(
     name="Werkzeug",
     version=version,
@@ -52,6 +65,7 @@ setup(
     packages=find_packages("src"),
     package_dir={"": "src"},
     include_package_data=True,
+    ext_modules=ext_modules,
     python_requires=">=2.7, !=3.0.*, !=3.1.*, !=3.2.*, !=3.3.*, !=3.4.*",
     extras_require={
         "watchdog": ["watchdog"],
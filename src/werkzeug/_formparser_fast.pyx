@@ -0,0 +1,156 @@
+# cython: language_level=3
+"""
+    werkzeug._formparser_fast
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compiled versions of the scanning helpers used by the multipart
+    parser in :mod:`werkzeug.formparser`.  The module is optional, it is
+    only built if the ``WERKZEUG_BUILD_EXT`` environment variable is set
+    when installing.  The functions behave like their pure Python
+    counterparts, except that negative indexes are not counted from the
+    end but clamped to the buffer like indexes past its end.
+
+    :copyright: 2007 Pallets
+    :license: BSD-3-Clause
+"""
+cimport cython
+from libc.string cimport memchr
+from libc.string cimport memcmp
+
+
+cdef enum:
+    LF = 10
+    CR = 13
+    DASH = 45
+
+
+cdef inline bint _is_space(unsigned char c) nogil:
+    # the same characters bytes.rstrip() removes
+    return c == 32 or 9 <= c <= 13
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _line_end(
+    const unsigned char[:] buf, Py_ssize_t start, Py_ssize_t stop
+) nogil:
+    cdef Py_ssize_t i = start
+    while i < stop:
+        if buf[i] == LF:
+            return i + 1
+        if buf[i] == CR:
+            if i + 1 == stop:
+                return -1
+            if buf[i + 1] == LF:
+                return i + 2
+            return i + 1
+        i += 1
+    return -1
+
+
+cdef inline (Py_ssize_t, Py_ssize_t) _bounds(
+    const unsigned char[:] buf, Py_ssize_t start, object stop
+):
+    # the scans don't check bounds, clamp the range to the buffer
+    cdef Py_ssize_t n = buf.shape[0]
+    cdef Py_ssize_t end = n if stop is None else stop
+    if end > n:
+        end = n
+    elif end < 0:
+        end = 0
+    if start > end:
+        start = end
+    elif start < 0:
+        start = 0
+    return start, end
+
+
+def _find_line_end(const unsigned char[:] buf, Py_ssize_t start=0, stop=None):
+    cdef Py_ssize_t end
+    start, end = _bounds(buf, start, stop)
+    return _line_end(buf, start, end)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _find_last_line_break(const unsigned char[:] buf, Py_ssize_t start=0, stop=None):
+    cdef Py_ssize_t i
+    start, i = _bounds(buf, start, stop)
+    i -= 1
+    while i >= start:
+        if buf[i] == LF:
+            if i > start and buf[i - 1] == CR:
+                return i - 1, i + 1
+            return i, i + 1
+        if buf[i] == CR:
+            return i, i + 1
+        i -= 1
+    return -1, -1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _find_boundary(
+    const unsigned char[:] buf,
+    bytes boundary,
+    Py_ssize_t start=0,
+    stop=None,
+    bint at_line_start=True,
+    bint eof=False,
+):
+    cdef const unsigned char* b = boundary
+    cdef Py_ssize_t m = len(boundary)
+    cdef Py_ssize_t n, idx
+    cdef Py_ssize_t tail_start, tail_end, end, dashes
+    cdef const unsigned char* p
+    cdef const void* found
+    cdef bint tail_ok
+
+    idx, n = _bounds(buf, start, stop)
+    if m == 0 or n < m:
+        return -1, -1, False
+    p = &buf[0]
+
+    while idx <= n - m:
+        found = memchr(p + idx, b[0], n - m - idx + 1)
+        if found == NULL:
+            break
+        idx = <const unsigned char*>found - p
+        if memcmp(p + idx, b, m) != 0 or (idx == 0 and not at_line_start) or (
+            idx > 0 and p[idx - 1] != CR and p[idx - 1] != LF
+        ):
+            idx += 1
+            continue
+
+        tail_start = idx + m
+        end = _line_end(buf, tail_start, n)
+        tail_end = n if end < 0 else end
+        while tail_end > tail_start and _is_space(p[tail_end - 1]):
+            tail_end -= 1
+        dashes = tail_end - tail_start
+        tail_ok = dashes == 0 or (
+            dashes == 2 and p[tail_start] == DASH and p[tail_start + 1] == DASH
+        )
+        if end < 0 and (tail_ok or (dashes == 1 and p[tail_start] == DASH)):
+            if not eof:
+                return idx, -1, False
+            end = n
+        if tail_ok:
+            return idx, end, dashes == 2
+        idx += 1
+
+    return -1, -1, False
+
+
+def _line_parse(line):
+    if isinstance(line, bytes):
+        if line.endswith(b"\r\n"):
+            return line[:-2], True
+        elif line.endswith((b"\r", b"\n")):
+            return line[:-1], True
+        return line, False
+    if line.endswith(u"\r\n"):
+        return line[:-2], True
+    elif line.endswith((u"\r", u"\n")):
+        return line[:-1], True
+    return line, False
@@ -10,14 +10,14 @@
     :license: BSD-3-Clause
 """
 import codecs
+import io
 import re
 from functools import update_wrapper
-from itertools import chain
-from itertools import repeat
 from itertools import tee
 
 from . import exceptions
 from ._compat import BytesIO
+from ._compat import PY2
 from ._compat import text_type
 from ._compat import to_native
 from .datastructures import FileStorage
@@ -25,9 +25,19 @@ from .datastructures import Headers
 from .datastructures import MultiDict
 from .http import parse_options_header
 from .urls import url_decode_stream
+from .wsgi import _make_chunk_iter
 from .wsgi import get_content_length
 from .wsgi import get_input_stream
-from .wsgi import make_line_iter
+from .wsgi import LimitedStream
+
+try:
+    from queue import Empty
+    from queue import Full
+    from queue import LifoQueue
+except ImportError:  # Python 2
+    from Queue import Empty
+    from Queue import Full
+    from Queue import LifoQueue
 
 # there are some platforms where SpooledTemporaryFile is not available.
 # In that case we need to provide a fallback.
@@ -39,12 +49,38 @@ except ImportError:
     SpooledTemporaryFile = None
 
 
-#: an iterator that yields empty strings
-_empty_string_iter = repeat("")
+#: types of the file containers created by :func:`default_stream_factory`.
+#: They copy what is written to them, so the data of file parts is written
+#: into them straight from the read buffer.  Any other container gets bytes
+#: as it might keep the object or not support memoryviews.
+if PY2:
+    _view_writers = ()
+elif SpooledTemporaryFile is not None:
+    _view_writers = (BytesIO, io.BufferedRandom, SpooledTemporaryFile)
+else:
+    _view_writers = (BytesIO, io.BufferedRandom)
+
+#: read buffers of the multipart parser that can be reused.  The pool is
+#: limited in size and only small buffers are kept.
+_buffer_pool = LifoQueue(maxsize=64)
+_max_pooled_buffer_size = 1024 * 256
+
+#: the bytes base64 decoding skips over
+_non_base64_chars = bytes(bytearray(range(256))).translate(
+    None, b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+)
 
 #: a regular expression for multipart boundaries
 _multipart_boundary_re = re.compile("^[ -~]{0,200}[!-~]$")
 
+#: the first byte bytes.strip() keeps, blank lines in front of the first
+#: boundary are skipped up to it
+_non_space_re = re.compile(b"[^ \t\n\r\x0b\x0c]")
+
+#: the first byte in the rest of a boundary line that is not blank, only
+#: blanks may follow the dashes
+_non_blank_re = re.compile(b"[^ \t\x0b\x0c]")
+
 #: supported http encodings that are also available in python we support
 #: for multipart messages.
 _supported_multipart_encodings = frozenset(["base64", "quoted-printable"])
@@ -288,9 +324,15 @@ def _line_parse(line):
     """Removes line ending characters and returns a tuple (`stripped_line`,
     `is_terminated`).
     """
-    if line[-2:] in ["\r\n", b"\r\n"]:
+    if isinstance(line, bytes):
+        if line.endswith(b"\r\n"):
+            return line[:-2], True
+        elif line.endswith((b"\r", b"\n")):
+            return line[:-1], True
+        return line, False
+    if line.endswith(u"\r\n"):
         return line[:-2], True
-    elif line[-1:] in ["\r", "\n", b"\r", b"\n"]:
+    elif line.endswith((u"\r", u"\n")):
         return line[:-1], True
     return line, False
 
@@ -302,9 +344,15 @@ def parse_multipart_headers(iterable):
     The iterable will stop at the line where the headers ended so it can be
     further consumed.
 
-    :param iterable: iterable of strings that are newline terminated
+    The headers can also be passed as a single bytestring that is split
+    into lines.
+
+    :param iterable: iterable of strings that are newline terminated, or
+                     a bytestring
     """
-    result = []
+    if isinstance(iterable, (bytes, bytearray)):
+        iterable = bytes(iterable).splitlines(True)
+    lines = []
     for line in iterable:
         line = to_native(line)
         line, line_terminated = _line_parse(line)
@@ -312,7 +360,17 @@ def parse_multipart_headers(iterable):
             raise ValueError("unexpected end of line in multipart header")
         if not line:
             break
-        elif line[0] in " \t" and result:
+        lines.append(line)
+    return _parse_header_lines(lines)
+
+
+def _parse_header_lines(lines):
+    """Creates the headers from a list of non-empty native header lines
+    without their line breaks.
+    """
+    result = []
+    for line in lines:
+        if line[0] in " \t" and result:
             key, value = result[-1]
             result[-1] = (key, value + "\n " + line[1:])
         else:
@@ -325,12 +383,488 @@ def parse_multipart_headers(iterable):
     return Headers(result)
 
 
+def _find_line_end(buf, start=0, stop=None):
+    """Returns the index right behind the first line break in `buf` between
+    `start` and `stop`, or ``-1`` if there is none yet.  A ``\\r`` at the
+    very end does not count as it could be the first half of a ``\\r\\n``.
+    """
+    if stop is None or stop > len(buf):
+        stop = len(buf)
+    lf = buf.find(b"\n", start, stop)
+    cr = buf.find(b"\r", start, stop if lf < 0 else lf)
+    if cr < 0:
+        return lf if lf < 0 else lf + 1
+    if cr + 1 == lf:
+        return lf + 1
+    if cr + 1 == stop:
+        return -1
+    return cr + 1
+
+
+def _find_last_line_break(buf, start=0, stop=None):
+    """Returns a tuple (`break_start`, `line_start`) for the last line break
+    in `buf` between `start` and `stop`.  Both are ``-1`` if there is no
+    line break.
+    """
+    if stop is None:
+        stop = len(buf)
+    lf = buf.rfind(b"\n", start, stop)
+    cr = buf.rfind(b"\r", start, stop)
+    if lf > cr:
+        return (cr if cr >= 0 and cr == lf - 1 else lf), lf + 1
+    if cr >= 0:
+        return cr, cr + 1
+    return -1, -1
+
+
+def _find_boundary(buf, boundary, start=0, stop=None, at_line_start=True, eof=False):
+    """Searches `buf` between `start` and `stop` for a line that holds
+    `boundary`, optionally followed by ``--`` and whitespace.  Returns a
+    tuple (`index`, `end`, `is_last`) where `end` is the index behind the
+    line break of the boundary line.  `index` is ``-1`` if there is no
+    boundary, `end` is ``-1`` if more data is needed to tell if the match is
+    a boundary.  Unless `eof` is set a boundary line is only accepted once
+    its line break was seen.  `at_line_start` tells if the first byte of
+    `buf` starts a line.
+    """
+    if stop is None or stop > len(buf):
+        stop = len(buf)
+    while 1:
+        idx = buf.find(boundary, start, stop)
+        if idx < 0:
+            return -1, -1, False
+        if (idx == 0 and not at_line_start) or (
+            idx > 0 and buf[idx - 1 : idx] not in (b"\r", b"\n")
+        ):
+            start = idx + 1
+            continue
+        tail_start = idx + len(boundary)
+        end = _find_line_end(buf, tail_start, stop)
+        tail = bytes(buf[tail_start : stop if end < 0 else end]).rstrip()
+        if end < 0 and tail in (b"", b"-", b"--"):
+            if not eof:
+                return idx, -1, False
+            end = stop
+        if tail in (b"", b"--"):
+            return idx, end, tail == b"--"
+        start = idx + 1
+
+
+# the line scanning helpers have an optional compiled implementation, the
+# pure Python versions are kept to compare them
+_py_find_boundary = _find_boundary
+_py_find_last_line_break = _find_last_line_break
+_py_find_line_end = _find_line_end
+_py_line_parse = _line_parse
+try:
+    from ._formparser_fast import _find_boundary  # noqa: F811
+    from ._formparser_fast import _find_last_line_break  # noqa: F811
+    from ._formparser_fast import _find_line_end  # noqa: F811
+    from ._formparser_fast import _line_parse  # noqa: F811
+except ImportError:
+    pass
+
+
+def _get_part_length(headers):
+    """Returns the length a part declares in its ``Content-Length`` header
+    if it is valid and small enough to be read ahead into a pooled buffer.
+    """
+    length = headers.get("content-length")
+    if length is None:
+        return None
+    try:
+        length = int(length)
+    except ValueError:
+        return None
+    if 0 <= length <= _max_pooled_buffer_size // 2:
+        return length
+    return None
+
+
+def _split_encoded(raw, encoding):
+    """Splits the transfer encoded data `raw` collected so far into a
+    prefix that can be decoded on its own and the rest that has to wait
+    for more data.  Base64 data is split after the last complete group of
+    four characters, quoted-printable data in front of the last line which
+    could still end at the boundary.
+    """
+    if encoding == "base64_codec":
+        raw = raw.translate(None, _non_base64_chars)
+        cut = len(raw) - len(raw) % 4
+    else:
+        end = len(raw)
+        if raw[-2:] == b"\r\n":
+            end -= 2
+        elif raw[-1:] in (b"\r", b"\n"):
+            end -= 1
+        cut = _find_last_line_break(raw, 0, end)[1]
+        if cut < 0:
+            # a single long line, don't split an escape sequence
+            cut = raw.rfind(b"=", max(end - 2, 0), end)
+            if cut < 0:
+                cut = end
+    return raw[:cut], raw[cut:]
+
+
+def _get_buffer(size):
+    """Takes a buffer of at least `size` bytes from the pool or creates a
+    new one.
+    """
+    try:
+        buf = _buffer_pool.get_nowait()
+    except Empty:
+        return bytearray(size)
+    if len(buf) < size:
+        return bytearray(size)
+    return buf
+
+
+def _put_buffer(buf):
+    """Returns a buffer to the pool unless it grew too large or the pool
+    is full already.
+    """
+    if len(buf) <= _max_pooled_buffer_size:
+        try:
+            _buffer_pool.put_nowait(buf)
+        except Full:
+            pass
+
+
+class _ReadBuffer(object):
+    """The buffer of :class:`MultiPartStateMachine`.  The bytearray in
+    `data` is borrowed from the buffer pool and never resized so that the
+    allocation is reused across requests.  The unread data is
+    ``data[pos:stop]``, the bytes in front of `pos` are the ones consumed
+    last.
+    """
+
+    def __init__(self, buffer_size):
+        self.data = _get_buffer(buffer_size * 2)
+        self.pos = self.stop = 0
+        #: tells if the first byte of `data` starts a line
+        self.at_line_start = True
+
+    def starts_line(self):
+        """Tells if the unread data starts at the beginning of a line."""
+        if self.pos > 0:
+            return self.data[self.pos - 1 : self.pos] in (b"\r", b"\n")
+        return self.at_line_start
+
+    def append(self, chunk):
+        """Adds a chunk behind the unread data.  The unread data is moved to
+        the front first if the chunk does not fit behind it.
+        """
+        data = self.data
+        pos = self.pos
+        size = self.stop - pos
+        if self.stop + len(chunk) > len(data):
+            self.at_line_start = self.starts_line()
+            if size + len(chunk) > len(data):
+                self.data = bytearray(max(len(data) * 2, size + len(chunk)))
+                self.data[:size] = data[pos : self.stop]
+                _put_buffer(data)
+            else:
+                data[:size] = data[pos : self.stop]
+            self.pos = 0
+            self.stop = size
+        self.data[self.stop : self.stop + len(chunk)] = chunk
+        self.stop += len(chunk)
+
+    def release(self):
+        if self.data is not None:
+            _put_buffer(self.data)
+            self.data = None
+
+
+def _get_reader(stream, limit, buffer_size):
+    """Returns a function that reads up to the given number of bytes from
+    `stream`, which can also be an iterable of chunks.
+    """
+    if hasattr(stream, "read"):
+        if limit is not None and not isinstance(stream, LimitedStream):
+            stream = LimitedStream(stream, limit)
+        return stream.read
+    chunks = _make_chunk_iter(stream, limit, buffer_size)
+    return lambda size: next(chunks, b"")
+
+
 _begin_form = "begin_form"
 _begin_file = "begin_file"
 _cont = "cont"
 _end = "end"
 
 
+class MultiPartStateMachine(object):
+    """Parses a multipart body that is passed in chunks to :meth:`feed`
+    without doing any IO itself.  This allows parsing data that does not
+    come from a file-like object, for example chunks received by an
+    asynchronous server.  :class:`MultiPartParser` uses it to parse the
+    streams it reads.
+
+    :meth:`feed` returns the events that the chunk completes:
+
+    ``('begin_form', (headers, name))``
+    ``('begin_file', (headers, name, filename))``
+    ``('cont', bytestring)``
+    ``('end', None)``
+
+    Transfer encoded parts are not decoded.  Call :meth:`close` once the
+    machine is no longer used to give the buffer back.
+
+    .. versionadded:: 1.0.2
+
+    :param boundary: the multipart boundary as bytestring.
+    :param buffer_size: the size of the internal buffer.
+    :param cap_at_buffer: if disabled ``cont`` chunks always end at a line
+                          break.
+    """
+
+    #: waiting for the first boundary
+    BOUNDARY = 0
+    #: reading the headers of a part
+    HEADER = 1
+    #: reading the data of a part
+    BODY = 2
+    #: the last boundary was found, data following it is ignored
+    EPILOGUE = 3
+
+    def __init__(self, boundary, buffer_size=64 * 1024, cap_at_buffer=True):
+        self.next_part = b"--" + boundary
+        self.last_part = self.next_part + b"--"
+        self.buffer_size = buffer_size
+        self.cap_at_buffer = cap_at_buffer
+        self.state = self.BOUNDARY
+        self._window = _ReadBuffer(buffer_size)
+        self._eof = False
+        # where scanning continues, relative to the unread data
+        self._offset = 0
+        self._part_length = None
+        # the headers of the current part until its length was looked up
+        self._part_headers = None
+        # where checking the rest of a boundary line continues, relative to
+        # the unread data, if the line was found without its line break
+        self._tail = None
+        # the header lines of the current part scanned so far
+        self._lines = []
+
+    def fail(self, message):
+        raise ValueError(message)
+
+    def feed(self, data):
+        """Parses the next chunk of the body and returns a list of the
+        events it completes.  An empty chunk marks the end of the body.
+        """
+        return [
+            (ellt, ell.tobytes() if ellt == _cont else ell)
+            for ellt, ell in self._feed(data)
+        ]
+
+    def _feed(self, data):
+        # Works like feed() but the data of cont events are memoryviews of
+        # the buffer.  They are only valid until the next call, the buffer
+        # is reused by other machines after close().
+        if self._window.data is None:
+            raise ValueError("feed() called after close()")
+        if data:
+            self._window.append(data)
+        else:
+            self._eof = True
+        events = []
+        steps = (self._parse_boundary, self._parse_header, self._parse_body)
+        while self.state != self.EPILOGUE and steps[self.state](events):
+            pass
+        if self.state == self.EPILOGUE:
+            self._window.pos = self._window.stop
+        return events
+
+    def wants(self):
+        """Returns how many more bytes are needed to reach the boundary after
+        the current part if it declared its length, otherwise ``0``.  Feeding
+        them at once ends the part with a single call.
+        """
+        if self._part_headers is not None:
+            # only parts that span more than one read need their length
+            self._part_length = _get_part_length(self._part_headers)
+            self._part_headers = None
+        if self.state != self.BODY or self._part_length is None:
+            return 0
+        window = self._window
+        # the boundary line is the boundary between two line breaks of up to
+        # two bytes each, followed by ``--`` after the last part
+        needed = self._part_length + len(self.next_part) + 6
+        return max(needed - (window.stop - window.pos), 0)
+
+    def close(self):
+        """Gives the internal buffer back, the machine can't be fed after
+        this.
+        """
+        self._window.release()
+
+    def _parse_boundary(self, events):
+        # skip blank lines in front of the first boundary
+        window = self._window
+        match = _non_space_re.search(window.data, window.pos, window.stop)
+        window.pos = window.stop if match is None else match.start()
+        end = _find_line_end(window.data, window.pos, window.stop)
+        if end < 0:
+            if not self._eof and not (
+                self.cap_at_buffer and window.stop - window.pos >= self.buffer_size
+            ):
+                return False
+            end = window.stop
+        terminator = bytes(window.data[window.pos : end]).strip()
+        window.pos = end
+
+        if terminator == self.last_part:
+            self.state = self.EPILOGUE
+        elif terminator != self.next_part:
+            self.fail("Expected boundary at start of multipart data")
+        else:
+            self.state = self.HEADER
+            self._offset = 0
+        return True
+
+    def _parse_header(self, events):
+        # the headers end with the first blank line
+        window = self._window
+        data = window.data
+        pos = window.pos
+        lines = None
+        if not self._offset:
+            # Most clients end all lines with CRLF, then the header block
+            # ends at the first empty line and can be split at once.
+            end = data.find(b"\r\n\r\n", pos, window.stop)
+            if end > pos and (not self.cap_at_buffer or end - pos < self.buffer_size):
+                block = bytes(data[pos:end])
+                crlf = block.count(b"\r\n")
+                if (
+                    data[pos] != 13
+                    and block.count(b"\r") == crlf
+                    and block.count(b"\n") == crlf
+                ):
+                    lines = to_native(block).split("\r\n")
+                    end += 4
+        if lines is None:
+            end = self._scan_header()
+            if end < 0:
+                return False
+            lines = self._lines
+            self._lines = []
+        headers = _parse_header_lines(lines)
+        window.pos = end
+
+        disposition = headers.get("content-disposition")
+        if disposition is None:
+            self.fail("Missing Content-Disposition header")
+        disposition, extra = parse_options_header(disposition)
+        name = extra.get("name")
+        filename = extra.get("filename")
+
+        if filename is None:
+            events.append((_begin_form, (headers, name)))
+        else:
+            events.append((_begin_file, (headers, name, filename)))
+        self.state = self.BODY
+        self._offset = 0
+        self._part_length = None
+        self._part_headers = headers
+        return True
+
+    def _scan_header(self):
+        # Scans the headers line by line, returns the index behind the blank
+        # line or -1 if more data is needed.
+        window = self._window
+        data = window.data
+        lines = self._lines
+        line_start = window.pos + self._offset
+        while 1:
+            end = _find_line_end(data, line_start, window.stop)
+            # a header line may not fill the whole buffer, no matter how the
+            # data was fed
+            line_end = window.stop if end < 0 else end
+            while line_end > line_start and data[line_end - 1] in (10, 13):
+                line_end -= 1
+            if (end < 0 and self._eof) or (
+                self.cap_at_buffer and line_end - line_start >= self.buffer_size
+            ):
+                self.fail("unexpected end of line in multipart header")
+            if end < 0:
+                self._offset = line_start - window.pos
+                return -1
+            if line_end == line_start:
+                return end
+            lines.append(to_native(bytes(data[line_start:line_end])))
+            line_start = end
+
+    def _parse_body(self, events):
+        window = self._window
+        data = window.data
+        pos = window.pos
+        stop = window.stop
+        next_part = self.next_part
+        eof = self._eof
+        if self._tail is not None:
+            # Only blanks followed the boundary so far, the line is checked
+            # again once something else arrives.  Like a header line it may
+            # not fill the whole buffer.
+            match = _non_blank_re.search(data, pos + self._tail, stop)
+            if match is None and not eof:
+                if not (
+                    self.cap_at_buffer
+                    and stop - pos - self._offset >= self.buffer_size
+                ):
+                    self._tail = stop - pos
+                    return False
+                eof = True
+            self._tail = None
+        idx, end, is_last = _find_boundary(
+            data, next_part, pos + self._offset, stop, window.at_line_start, eof
+        )
+
+        if idx < 0:
+            # Everything in front of the last line break can be passed on.
+            # Whatever follows it is held back if it could still turn into a
+            # boundary with more data.
+            cut, line_start = _find_last_line_break(data, pos, stop)
+            if cut < 0 and window.starts_line():
+                cut = line_start = pos
+            if not self.cap_at_buffer:
+                cut = max(cut, pos)
+            elif cut < 0 or not (
+                stop - line_start < len(next_part)
+                and next_part.startswith(bytes(data[line_start:stop]))
+            ):
+                cut = stop
+            if cut > pos:
+                events.append((_cont, memoryview(data)[pos:cut]))
+                window.pos = cut
+            if self._eof:
+                self.fail("unexpected end of stream")
+            self._offset = max(stop - len(next_part) + 1 - window.pos, 0)
+            return False
+
+        if end < 0:
+            # the end of the boundary line is still missing
+            self._offset = idx - pos
+            self._tail = stop - pos
+            return False
+
+        # the line break in front of the boundary belongs to it
+        cut = idx
+        if idx - 2 >= pos and data[idx - 2 : idx] == b"\r\n":
+            cut -= 2
+        elif idx > pos:
+            cut -= 1
+        if cut > pos:
+            events.append((_cont, memoryview(data)[pos:cut]))
+        window.pos = end
+        events.append((_end, None))
+        self.state = self.EPILOGUE if is_last else self.HEADER
+        self._offset = 0
+        self._part_length = self._part_headers = None
+        return True
+
+
 class MultiPartParser(object):
     def __init__(
         self,
@@ -443,138 +977,138 @@ class MultiPartParser(object):
         Always obeys the grammar
         parts = ( begin_form cont* end |
                   begin_file cont* end )*
-        """
-        next_part = b"--" + boundary
-        last_part = next_part + b"--"
-
-        iterator = chain(
-            make_line_iter(
-                file,
-                limit=content_length,
-                buffer_size=self.buffer_size,
-                cap_at_buffer=cap_at_buffer,
-            ),
-            _empty_string_iter,
-        )
-
-        terminator = self._find_terminator(iterator)
 
-        if terminator == last_part:
-            return
-        elif terminator != next_part:
-            self.fail("Expected boundary at start of multipart data")
-
-        while terminator != last_part:
-            headers = parse_multipart_headers(iterator)
-
-            disposition = headers.get("content-disposition")
-            if disposition is None:
-                self.fail("Missing Content-Disposition header")
-            disposition, extra = parse_options_header(disposition)
-            transfer_encoding = self.get_part_encoding(headers)
-            name = extra.get("name")
-            filename = extra.get("filename")
-
-            # if no content type is given we stream into memory.  A list is
-            # used as a temporary container.
-            if filename is None:
-                yield _begin_form, (headers, name)
-
-            # otherwise we parse the rest of the headers and ask the stream
-            # factory for something we can write in.
-            else:
-                yield _begin_file, (headers, name, filename)
-
-            buf = b""
-            for line in iterator:
-                if not line:
-                    self.fail("unexpected end of stream")
-
-                if line[:2] == b"--":
-                    terminator = line.rstrip()
-                    if terminator in (next_part, last_part):
-                        break
-
-                if transfer_encoding is not None:
-                    if transfer_encoding == "base64":
-                        transfer_encoding = "base64_codec"
-                    try:
-                        line = codecs.decode(line, transfer_encoding)
-                    except Exception:
-                        self.fail("could not decode transfer encoded chunk")
-
-                # we have something in the buffer from the last iteration.
-                # this is usually a newline delimiter.
-                if buf:
-                    yield _cont, buf
-                    buf = b""
-
-                # If the line ends with windows CRLF we write everything except
-                # the last two bytes.  In all other cases however we write
-                # everything except the last byte.  If it was a newline, that's
-                # fine, otherwise it does not matter because we will write it
-                # the next iteration.  this ensures we do not write the
-                # final newline into the stream.  That way we do not have to
-                # truncate the stream.  However we do have to make sure that
-                # if something else than a newline is in there we write it
-                # out.
-                if line[-2:] == b"\r\n":
-                    buf = b"\r\n"
-                    cutoff = -2
-                else:
-                    buf = line[-1:]
-                    cutoff = -1
-                yield _cont, line[:cutoff]
-
-            else:  # pragma: no cover
-                raise ValueError("unexpected end of part")
+        The body of a part is not split into lines.  The input is read into
+        a buffer that is searched for the next boundary as a whole and
+        everything in front of it is emitted as one ``cont`` chunk.  If
+        `cap_at_buffer` is disabled chunks always end at a line break.
+        """
+        return self._pump(file, boundary, content_length, cap_at_buffer)
+
+    def _pump(self, file, boundary, content_length, cap_at_buffer=True):
+        """Works like :meth:`parse_lines` but the consumer can pass a
+        callable to :meth:`send` when it receives a ``begin_form`` or
+        ``begin_file`` event.  The data of that part is then written into
+        the callable directly instead of being generated as ``cont`` events.
+        The callable receives memoryviews of the read buffer that are only
+        valid during the call.  The :meth:`send` call itself returns `None`.
+
+        The stream is read here and fed to a :class:`MultiPartStateMachine`,
+        transfer encoded parts are decoded on the way.
+        """
+        machine = MultiPartStateMachine(boundary, self.buffer_size, cap_at_buffer)
+        # the errors of the machine are raised by the parser
+        machine.fail = self.fail
+        read = _get_reader(file, content_length, self.buffer_size)
 
-            # if we have a leftover in the buffer that is not a newline
-            # character we have to flush it, otherwise we will chop of
-            # certain values.
-            if buf not in (b"", b"\r", b"\n", b"\r\n"):
-                yield _cont, buf
+        transfer_encoding = write = None
 
-            yield _end, None
+        try:
+            while machine.state != machine.EPILOGUE:
+                # If a part declares its length, the data and the boundary
+                # behind it are read with as few calls as possible.  The
+                # length is only used for reading ahead, the part still ends
+                # at the first boundary.
+                chunk = read(max(machine.wants(), self.buffer_size))
+                for ellt, ell in machine._feed(chunk):
+                    if ellt == _begin_form or ellt == _begin_file:
+                        transfer_encoding = self.get_part_encoding(ell[0])
+                        if transfer_encoding == "base64":
+                            transfer_encoding = "base64_codec"
+                        raw = bytearray()
+                        write = yield ellt, ell
+                        if write is not None:
+                            # this is what the send() call of the consumer
+                            # returns
+                            yield None
+                        continue
+
+                    if transfer_encoding is None:
+                        if ellt == _end:
+                            yield _end, None
+                        elif write is None:
+                            yield _cont, ell.tobytes()
+                        else:
+                            write(ell)
+                        continue
+
+                    # The encoded data is collected and decoded in one go at
+                    # the end of the part.  Parts larger than the buffer are
+                    # decoded in blocks.
+                    if ellt == _cont:
+                        raw += ell
+                        if len(raw) < self.buffer_size:
+                            continue
+                        block, raw = _split_encoded(raw, transfer_encoding)
+                    else:
+                        block = raw
+                    if block:
+                        try:
+                            block = codecs.decode(block, transfer_encoding)
+                        except Exception:
+                            self.fail("could not decode transfer encoded chunk")
+                    if block:
+                        if write is None:
+                            yield _cont, block
+                        else:
+                            write(memoryview(block))
+                    if ellt == _end:
+                        yield _end, None
+        finally:
+            machine.close()
 
     def parse_parts(self, file, boundary, content_length, max_parts=None):
         """Generate ``('file', (name, val))`` and
         ``('form', (name, val))`` parts.
         """
         in_memory = 0
-        _parts_decoded = 0
+        parts_seen = 0
+
+        events = self.parse_lines(file, boundary, content_length)
+        # the data is only written from the read buffer directly if a
+        # subclass does not change the events
+        send = type(self).parse_lines == MultiPartParser.parse_lines
+        for ellt, ell in events:
+            if ellt in (_begin_file, _begin_form):
+                # stop at the first part over the limit, before its data is
+                # read or a container is created for it.
+                parts_seen += 1
+                if max_parts is not None and parts_seen > max_parts:
+                    raise exceptions.RequestEntityTooLarge()
 
-        for ellt, ell in self.parse_lines(file, boundary, content_length):
             if ellt == _begin_file:
                 headers, name, filename = ell
                 is_file = True
-                guard_memory = False
                 filename, container = self.start_file_streaming(
                     filename, headers, content_length
                 )
                 _write = container.write
+                if send and type(container) in _view_writers:
+                    events.send(_write)
 
             elif ellt == _begin_form:
                 headers, name = ell
                 is_file = False
-                container = []
-                _write = container.append
-                guard_memory = self.max_form_memory_size is not None
+                container = bytearray()
+                if self.max_form_memory_size is None:
+                    _write = container.extend
+                else:
+                    # if there is a memory size limit we count the bytes of
+                    # all form parts and raise an exception if there is too
+                    # much data in memory.
+                    def _write(data, container=container, in_memory=in_memory):
+                        container.extend(data)
+                        size = in_memory + len(container)
+                        if size > self.max_form_memory_size:
+                            self.in_memory_threshold_reached(size)
+
+                if send and not PY2:
+                    events.send(_write)
 
             elif ellt == _cont:
                 _write(ell)
-                # if we write into memory and there is a memory size limit we
-                # count the number of bytes in memory and raise an exception if
-                # there is too much data in memory.
-                if guard_memory:
-                    in_memory += len(ell)
-                    if in_memory > self.max_form_memory_size:
-                        self.in_memory_threshold_reached(in_memory)
 
             elif ellt == _end:
-                _parts_decoded += 1
-                if max_parts is not None and _parts_decoded > max_parts:
-                    raise exceptions.RequestEntityTooLarge()
                 if is_file:
                     container.seek(0)
                     yield (
@@ -582,11 +1116,9 @@ class MultiPartParser(object):
                         (name, FileStorage(container, filename, name, headers=headers)),
                     )
                 else:
+                    in_memory += len(container)
                     part_charset = self.get_part_charset(headers)
-                    yield (
-                        "form",
-                        (name, b"".join(container).decode(part_charset, self.errors)),
-                    )
+                    yield ("form", (name, container.decode(part_charset, self.errors)))
 
     def parse(self, file, boundary, content_length):
         formstream, filestream = tee(
@@ -8,10 +8,12 @@
     :copyright: 2007 Pallets
     :license: BSD-3-Clause
 """
-import csv
+import codecs
 import io
+import os
 from os.path import dirname
 from os.path import join
+from os.path import relpath
 
 import pytest
 
@@ -29,6 +31,22 @@ from werkzeug.wrappers import Request
 from werkzeug.wrappers import Response
 
 
+_encoded_reprs = {}
+
+
+def _encoded_repr(value):
+    """The ``repr`` of `value` encoded to ASCII.  It is only built once for
+    every value.  The type is part of the key because text and native
+    strings compare equal on Python 2 but have a different ``repr``.
+    """
+    key = (type(value), value)
+    try:
+        return _encoded_reprs[key]
+    except KeyError:
+        rv = _encoded_reprs[key] = repr(value).encode("ascii")
+        return rv
+
+
 @Request.application
 def form_data_consumer(request):
     result_object = request.args["object"]
@@ -38,9 +56,9 @@ def form_data_consumer(request):
     return Response(
         b"\n".join(
             (
-                repr(f.filename).encode("ascii"),
-                repr(f.name).encode("ascii"),
-                repr(f.content_type).encode("ascii"),
+                _encoded_repr(f.filename),
+                _encoded_repr(f.name),
+                _encoded_repr(f.content_type),
                 f.stream.read(),
             )
         )
@@ -52,34 +70,47 @@ def get_contents(filename):
         return f.read()
 
 
+def _mk_req(data, content_type, **attributes):
+    """Creates a POST request with `data` as body and sets the keyword
+    arguments as attributes on it, for example the limits.
+    """
+    req = Request.from_values(
+        input_stream=BytesIO(data),
+        content_length=len(data),
+        content_type=content_type,
+        method="POST",
+    )
+    for key, value in attributes.items():
+        setattr(req, key, value)
+    return req
+
+
+@pytest.fixture(scope="module")
+def multipart_data():
+    """The ``.http`` requests in the ``multipart`` folder by their path
+    relative to it.  Every file is only read once per module.
+    """
+    resources = join(dirname(__file__), "multipart")
+    rv = {}
+    for dirpath, _, filenames in os.walk(resources):
+        for filename in filenames:
+            if filename.endswith(".http"):
+                path = join(dirpath, filename)
+                rv[relpath(path, resources).replace(os.sep, "/")] = get_contents(path)
+    return rv
+
+
 class TestFormParser(object):
     def test_limiting(self):
         data = b"foo=Hello+World&bar=baz"
-        req = Request.from_values(
-            input_stream=BytesIO(data),
-            content_length=len(data),
-            content_type="application/x-www-form-urlencoded",
-            method="POST",
-        )
-        req.max_content_length = 400
+        urlencoded = "application/x-www-form-urlencoded"
+        req = _mk_req(data, urlencoded, max_content_length=400)
         strict_eq(req.form["foo"], u"Hello World")
 
-        req = Request.from_values(
-            input_stream=BytesIO(data),
-            content_length=len(data),
-            content_type="application/x-www-form-urlencoded",
-            method="POST",
-        )
-        req.max_form_memory_size = 7
+        req = _mk_req(data, urlencoded, max_form_memory_size=7)
         pytest.raises(RequestEntityTooLarge, lambda: req.form["foo"])
 
-        req = Request.from_values(
-            input_stream=BytesIO(data),
-            content_length=len(data),
-            content_type="application/x-www-form-urlencoded",
-            method="POST",
-        )
-        req.max_form_memory_size = 400
+        req = _mk_req(data, urlencoded, max_form_memory_size=400)
         strict_eq(req.form["foo"], u"Hello World")
 
         data = (
@@ -88,49 +119,20 @@ class TestFormParser(object):
             b"--foo\r\nContent-Disposition: form-field; name=bar\r\n\r\n"
             b"bar=baz\r\n--foo--"
         )
-        req = Request.from_values(
-            input_stream=BytesIO(data),
-            content_length=len(data),
-            content_type="multipart/form-data; boundary=foo",
-            method="POST",
-        )
-        req.max_content_length = 4
+        multipart = "multipart/form-data; boundary=foo"
+        req = _mk_req(data, multipart, max_content_length=4)
         pytest.raises(RequestEntityTooLarge, lambda: req.form["foo"])
 
-        req = Request.from_values(
-            input_stream=BytesIO(data),
-            content_length=len(data),
-            content_type="multipart/form-data; boundary=foo",
-            method="POST",
-        )
-        req.max_content_length = 400
+        req = _mk_req(data, multipart, max_content_length=400)
         strict_eq(req.form["foo"], u"Hello World")
 
-        req = Request.from_values(
-            input_stream=BytesIO(data),
-            content_length=len(data),
-            content_type="multipart/form-data; boundary=foo",
-            method="POST",
-        )
-        req.max_form_memory_size = 7
+        req = _mk_req(data, multipart, max_form_memory_size=7)
         pytest.raises(RequestEntityTooLarge, lambda: req.form["foo"])
 
-        req = Request.from_values(
-            input_stream=BytesIO(data),
-            content_length=len(data),
-            content_type="multipart/form-data; boundary=foo",
-            method="POST",
-        )
-        req.max_form_memory_size = 400
+        req = _mk_req(data, multipart, max_form_memory_size=400)
         strict_eq(req.form["foo"], u"Hello World")
 
-        req = Request.from_values(
-            input_stream=io.BytesIO(data),
-            content_length=len(data),
-            content_type="multipart/form-data; boundary=foo",
-            method="POST",
-        )
-        req.max_form_parts = 1
+        req = _mk_req(data, multipart, max_form_parts=1)
         pytest.raises(RequestEntityTooLarge, lambda: req.form["foo"])
 
     def test_missing_multipart_boundary(self):
@@ -174,6 +176,8 @@ class TestFormParser(object):
         ("no_spooled", "size"), ((False, 100), (False, 3000), (True, 100), (True, 3000))
     )
     def test_default_stream_factory(self, no_spooled, size, monkeypatch):
+        import csv
+
         if no_spooled:
             monkeypatch.setattr("werkzeug.formparser.SpooledTemporaryFile", None)
 
@@ -249,86 +253,88 @@ class TestFormParser(object):
         assert stream is not None
 
 
-class TestMultiPart(object):
-    def test_basic(self):
-        resources = join(dirname(__file__), "multipart")
-        client = Client(form_data_consumer, Response)
+repository = [
+    (
+        "firefox3-2png1txt",
+        "---------------------------186454651713519341951581030105",
+        [
+            (u"anchor.png", "file1", "image/png", "file1.png"),
+            (u"application_edit.png", "file2", "image/png", "file2.png"),
+        ],
+        u"example text",
+    ),
+    (
+        "firefox3-2pnglongtext",
+        "---------------------------14904044739787191031754711748",
+        [
+            (u"accept.png", "file1", "image/png", "file1.png"),
+            (u"add.png", "file2", "image/png", "file2.png"),
+        ],
+        u"--long text\r\n--with boundary\r\n--lookalikes--",
+    ),
+    (
+        "opera8-2png1txt",
+        "----------zEO9jQKmLc2Cq88c23Dx19",
+        [
+            (u"arrow_branch.png", "file1", "image/png", "file1.png"),
+            (u"award_star_bronze_1.png", "file2", "image/png", "file2.png"),
+        ],
+        u"blafasel öäü",
+    ),
+    (
+        "webkit3-2png1txt",
+        "----WebKitFormBoundaryjdSFhcARk8fyGNy6",
+        [
+            (u"gtk-apply.png", "file1", "image/png", "file1.png"),
+            (u"gtk-no.png", "file2", "image/png", "file2.png"),
+        ],
+        u"this is another text with ümläüts",
+    ),
+    (
+        "ie6-2png1txt",
+        "---------------------------7d91b03a20128",
+        [
+            (u"file1.png", "file1", "image/x-png", "file1.png"),
+            (u"file2.png", "file2", "image/x-png", "file2.png"),
+        ],
+        u"ie6 sucks :-/",
+    ),
+]
 
-        repository = [
-            (
-                "firefox3-2png1txt",
-                "---------------------------186454651713519341951581030105",
-                [
-                    (u"anchor.png", "file1", "image/png", "file1.png"),
-                    (u"application_edit.png", "file2", "image/png", "file2.png"),
-                ],
-                u"example text",
-            ),
-            (
-                "firefox3-2pnglongtext",
-                "---------------------------14904044739787191031754711748",
-                [
-                    (u"accept.png", "file1", "image/png", "file1.png"),
-                    (u"add.png", "file2", "image/png", "file2.png"),
-                ],
-                u"--long text\r\n--with boundary\r\n--lookalikes--",
-            ),
-            (
-                "opera8-2png1txt",
-                "----------zEO9jQKmLc2Cq88c23Dx19",
-                [
-                    (u"arrow_branch.png", "file1", "image/png", "file1.png"),
-                    (u"award_star_bronze_1.png", "file2", "image/png", "file2.png"),
-                ],
-                u"blafasel öäü",
-            ),
-            (
-                "webkit3-2png1txt",
-                "----WebKitFormBoundaryjdSFhcARk8fyGNy6",
-                [
-                    (u"gtk-apply.png", "file1", "image/png", "file1.png"),
-                    (u"gtk-no.png", "file2", "image/png", "file2.png"),
-                ],
-                u"this is another text with ümläüts",
-            ),
-            (
-                "ie6-2png1txt",
-                "---------------------------7d91b03a20128",
-                [
-                    (u"file1.png", "file1", "image/x-png", "file1.png"),
-                    (u"file2.png", "file2", "image/x-png", "file2.png"),
-                ],
-                u"ie6 sucks :-/",
-            ),
-        ]
 
-        for name, boundary, files, text in repository:
-            folder = join(resources, name)
-            data = get_contents(join(folder, "request.http"))
-            for filename, field, content_type, fsname in files:
-                response = client.post(
-                    "/?object=" + field,
-                    data=data,
-                    content_type='multipart/form-data; boundary="%s"' % boundary,
-                    content_length=len(data),
-                )
-                lines = response.get_data().split(b"\n", 3)
-                strict_eq(lines[0], repr(filename).encode("ascii"))
-                strict_eq(lines[1], repr(field).encode("ascii"))
-                strict_eq(lines[2], repr(content_type).encode("ascii"))
-                strict_eq(lines[3], get_contents(join(folder, fsname)))
+class TestMultiPart(object):
+    @pytest.mark.parametrize(
+        ("name", "boundary", "files", "text"),
+        repository,
+        ids=[r[0] for r in repository],
+    )
+    def test_basic(self, multipart_data, name, boundary, files, text):
+        client = Client(form_data_consumer, Response)
+        folder = join(dirname(__file__), "multipart", name)
+        data = multipart_data[name + "/request.http"]
+        for filename, field, content_type, fsname in files:
             response = client.post(
-                "/?object=text",
+                "/?object=" + field,
                 data=data,
                 content_type='multipart/form-data; boundary="%s"' % boundary,
                 content_length=len(data),
             )
-            strict_eq(response.get_data(), repr(text).encode("utf-8"))
+            lines = response.get_data().split(b"\n", 3)
+            strict_eq(lines[0], _encoded_repr(filename))
+            strict_eq(lines[1], _encoded_repr(field))
+            strict_eq(lines[2], _encoded_repr(content_type))
+            strict_eq(lines[3], get_contents(join(folder, fsname)))
+        response = client.post(
+            "/?object=text",
+            data=data,
+            content_type='multipart/form-data; boundary="%s"' % boundary,
+            content_length=len(data),
+        )
+        strict_eq(response.get_data(), repr(text).encode("utf-8"))
 
-    def test_ie7_unc_path(self):
+    def test_ie7_unc_path(self, multipart_data):
         client = Client(form_data_consumer, Response)
-        data_file = join(dirname(__file__), "multipart", "ie7_full_path_request.http")
-        data = get_contents(data_file)
+        data = multipart_data["ie7_full_path_request.http"]
         boundary = "---------------------------7da36d1b4a0164"
         response = client.post(
             "/?object=cb_file_upload_multiple",
@@ -496,6 +502,13 @@ class TestMultiPart(object):
             ValueError, formparser.parse_multipart_headers, ["foo: bar\r\n", " x test"]
         )
 
+        x = formparser.parse_multipart_headers(b"foo: bar\r\n x test\rbaz: 1\n\r\n")
+        strict_eq(x["foo"], "bar\n x test")
+        strict_eq(x["baz"], "1")
+        pytest.raises(
+            ValueError, formparser.parse_multipart_headers, b"foo: bar\r\n x test"
+        )
+
     def test_bad_newline_bad_newline_assumption(self):
         class ISORequest(Request):
             charset = "latin1"
@@ -513,6 +526,47 @@ class TestMultiPart(object):
         )
         strict_eq(req.form["test"], u"Sk\xe5ne l\xe4n")
 
+    @pytest.mark.parametrize("size", (1020, 1021, 1022, 1023, 1024, 1025, 3000))
+    def test_boundary_across_buffer(self, size):
+        contents = (b"x--foo\r\n--fo" * size)[:size]
+        data = (
+            b'--foo\r\nContent-Disposition: form-data; name="test"; '
+            b'filename="test.txt"\r\n\r\n' + contents + b"\r\n--foo--\r\n"
+        )
+        parser = formparser.MultiPartParser(buffer_size=1024)
+        form, files = parser.parse(BytesIO(data), b"foo", len(data))
+        strict_eq(files["test"].read(), contents)
+
+    @pytest.mark.parametrize("size", (10, 1024, 3000))
+    def test_encoded_boundary_across_buffer(self, size):
+        contents = (b"--foo-x\r\n--fo" * size)[:size]
+        data = (
+            b'--foo\r\nContent-Disposition: form-data; name="test"; '
+            b'filename="test.txt"\r\nContent-Transfer-Encoding: base64\r\n\r\n'
+            + codecs.encode(contents, "base64")
+            + b"--foo--\r\n"
+        )
+        parser = formparser.MultiPartParser(buffer_size=1024)
+        form, files = parser.parse(BytesIO(data), b"foo", len(data))
+        strict_eq(files["test"].read(), contents)
+
+    @pytest.mark.parametrize(
+        ("encoding", "encoded"),
+        (("base64", b"bGluZQ0K"), ("quoted-printable", b"line=0D=0A")),
+    )
+    def test_encoded_trailing_newline(self, encoding, encoded):
+        data = (
+            b'--foo\r\nContent-Disposition: form-data; name="test"; '
+            b'filename="test.txt"\r\nContent-Transfer-Encoding: '
+            + encoding.encode("ascii")
+            + b"\r\n\r\n"
+            + encoded
+            + b"\r\n--foo--\r\n"
+        )
+        parser = formparser.MultiPartParser()
+        form, files = parser.parse(BytesIO(data), b"foo", len(data))
+        strict_eq(files["test"].read(), b"line\r\n")
+
     def test_empty_multipart(self):
         environ = {}
         data = b"--boundary--"
@@ -562,6 +616,220 @@ class TestMultiPartParser(object):
         assert request.files["rfc2231"].filename == "a b c d e f.txt"
         assert request.files["rfc2231"].read() == b"file contents"
 
+    @pytest.mark.parametrize("length", (3000, 10, 5000, "x"))
+    def test_part_content_length(self, length):
+        contents = b"x" * 3000
+        data = (
+            b"--foo\r\n"
+            b'Content-Disposition: form-data; name="test"; filename="test.txt"\r\n'
+            b"Content-Length: " + str(length).encode("ascii") + b"\r\n\r\n"
+            + contents
+            + b"\r\n--foo--\r\n"
+        )
+        reads = []
+
+        class Stream(BytesIO):
+            def read(self, size=-1):
+                rv = BytesIO.read(self, size)
+                reads.append(len(rv))
+                return rv
+
+        parser = formparser.MultiPartParser(buffer_size=1024)
+        form, files = parser.parse(Stream(data), b"foo", len(data))
+        strict_eq(files["test"].read(), contents)
+        if length == 3000:
+            assert len(reads) == 2
+
+    def test_pump_into_writer(self):
+        data = (
+            b"--foo\r\n"
+            b'Content-Disposition: form-data; name="a"; filename="a.txt"\r\n\r\n'
+            b"file contents\r\n"
+            b"--foo\r\n"
+            b'Content-Disposition: form-data; name="b"\r\n\r\n'
+            b"value\r\n--foo--"
+        )
+        parser = formparser.MultiPartParser()
+        events = parser._pump(BytesIO(data), b"foo", len(data))
+        written = []
+        seen = []
+        for ellt, ell in events:
+            seen.append((ellt, ell[-1] if ellt.startswith("begin") else ell))
+            if ellt == "begin_file":
+                assert events.send(lambda view: written.append(view.tobytes())) is None
+        assert written == [b"file contents"]
+        assert seen == [
+            ("begin_file", "a.txt"),
+            ("end", None),
+            ("begin_form", "b"),
+            ("cont", b"value"),
+            ("end", None),
+        ]
+
+    def test_custom_container_gets_bytes(self):
+        class Container(io.RawIOBase):
+            def __init__(self):
+                self.chunks = []
+
+            def write(self, data):
+                self.chunks.append(data)
+                return len(data)
+
+            def seek(self, pos, whence=0):
+                return 0
+
+        containers = []
+
+        def stream_factory(**kwargs):
+            containers.append(Container())
+            return containers[-1]
+
+        parser = formparser.MultiPartParser(stream_factory, buffer_size=1024)
+        for contents in (b"a" * 10, b"x" * 10):
+            data = (
+                b"--foo\r\n"
+                b'Content-Disposition: form-data; name="a"; filename="a.txt"\r\n'
+                b"\r\n" + contents + b"\r\n--foo--\r\n"
+            )
+            parser.parse(BytesIO(data), b"foo", len(data))
+        assert [c.chunks for c in containers] == [[b"a" * 10], [b"x" * 10]]
+
+    def test_parse_lines_override(self):
+        class Parser(formparser.MultiPartParser):
+            def parse_lines(self, *args, **kwargs):
+                for ellt, ell in formparser.MultiPartParser.parse_lines(
+                    self, *args, **kwargs
+                ):
+                    if ellt == "cont":
+                        ell = ell.upper()
+                    yield ellt, ell
+
+        data = (
+            b"--foo\r\n"
+            b'Content-Disposition: form-data; name="a"; filename="a.txt"\r\n\r\n'
+            b"file\r\n"
+            b"--foo\r\n"
+            b'Content-Disposition: form-data; name="b"\r\n\r\n'
+            b"val\r\n--foo--\r\n"
+        )
+        form, files = Parser().parse(BytesIO(data), b"foo", len(data))
+        assert form["b"] == u"VAL"
+        assert files["a"].read() == b"FILE"
+
+    def test_fail_override(self):
+        class ParserError(Exception):
+            pass
+
+        class Parser(formparser.MultiPartParser):
+            def fail(self, message):
+                raise ParserError(message)
+
+        for data in (
+            b"--bar\r\n",
+            b"--foo\r\nContent-Type: text/plain\r\n\r\nx\r\n--foo--\r\n",
+            b'--foo\r\nContent-Disposition: form-data; name="a"\r\n\r\nx',
+        ):
+            with pytest.raises(ParserError):
+                Parser().parse(BytesIO(data), b"foo", len(data))
+
+    def test_reuse_with_other_boundary(self):
+        parser = formparser.MultiPartParser()
+        for boundary in (b"foo", b"bar", b"foo"):
+            data = (
+                b"--" + boundary + b"\r\n"
+                b'Content-Disposition: form-data; name="a"\r\n\r\n'
+                b"value\r\n--" + boundary + b"--\r\n"
+            )
+            form, files = parser.parse(BytesIO(data), boundary, len(data))
+            assert form["a"] == u"value"
+
+    def test_max_parts_stops_early(self):
+        data = (
+            b"--foo\r\n"
+            b'Content-Disposition: form-data; name="a"; filename="a.txt"\r\n\r\n'
+            b"a\r\n"
+            b"--foo\r\n"
+            b'Content-Disposition: form-data; name="b"; filename="b.txt"\r\n\r\n'
+            b"b\r\n--foo--"
+        )
+        created = []
+
+        def stream_factory(**kwargs):
+            created.append(kwargs["filename"])
+            return BytesIO()
+
+        parser = formparser.MultiPartParser(stream_factory, max_form_parts=1)
+        with pytest.raises(RequestEntityTooLarge):
+            parser.parse(BytesIO(data), b"foo", len(data))
+        assert created == ["a.txt"]
+
+
+class TestMultiPartStateMachine(object):
+    data = (
+        b"--foo\r\n"
+        b'Content-Disposition: form-data; name="a"\r\n\r\n'
+        b"value\r\n"
+        b"--foo\r\n"
+        b'Content-Disposition: form-data; name="b"; filename="b.txt"\r\n\r\n'
+        b"line\r\n--foo-\r\n"
+        b"--foo--\r\nepilogue"
+    )
+
+    @pytest.mark.parametrize("size", (1, 7, 1024))
+    def test_feed(self, size):
+        machine = formparser.MultiPartStateMachine(b"foo", buffer_size=1024)
+        events = []
+        for pos in range(0, len(self.data), size):
+            for ellt, ell in machine.feed(self.data[pos : pos + size]):
+                if ellt == "cont":
+                    if events[-1][0] == "cont":
+                        events[-1] = ("cont", events[-1][1] + ell)
+                        continue
+                elif ellt != "end":
+                    ell = ell[1:]
+                events.append((ellt, ell))
+        machine.close()
+        assert machine.state == machine.EPILOGUE
+        assert events == [
+            ("begin_form", ("a",)),
+            ("cont", b"value"),
+            ("end", None),
+            ("begin_file", ("b", "b.txt")),
+            ("cont", b"line\r\n--foo-"),
+            ("end", None),
+        ]
+
+    def test_cont_outlives_buffer(self):
+        first = formparser.MultiPartStateMachine(b"foo", buffer_size=1024)
+        events = first.feed(self.data)
+        first.close()
+        second = formparser.MultiPartStateMachine(b"foo", buffer_size=1024)
+        second.feed(self.data.replace(b"value", b"VALUE"))
+        second.close()
+        assert events[1] == ("cont", b"value")
+        assert isinstance(events[1][1], bytes)
+
+    def test_unexpected_end(self):
+        machine = formparser.MultiPartStateMachine(b"foo")
+        assert machine.feed(self.data[:52])[0][0] == "begin_form"
+        assert machine.state == machine.BODY
+        pytest.raises(ValueError, machine.feed, b"")
+        machine.close()
+        pytest.raises(ValueError, machine.feed, b"x")
+
+    def test_blank_boundary_tail(self):
+        machine = formparser.MultiPartStateMachine(b"foo", buffer_size=1024)
+        machine.feed(self.data[:52] + b"\r\n--foo")
+        fed = 0
+        with pytest.raises(ValueError):
+            while fed < 1024:
+                machine.feed(b" " * 1024)
+                fed += 1
+                window = machine._window
+                assert window.stop - window.pos <= 3 * 1024
+        assert fed < 4
+        machine.close()
+
 
 class TestInternalFunctions(object):
     def test_line_parser(self):
@@ -569,6 +837,10 @@ class TestInternalFunctions(object):
         assert formparser._line_parse("foo\r\n") == ("foo", True)
         assert formparser._line_parse("foo\r") == ("foo", True)
         assert formparser._line_parse("foo\n") == ("foo", True)
+        assert formparser._line_parse(b"foo") == (b"foo", False)
+        assert formparser._line_parse(b"foo\r\n") == (b"foo", True)
+        assert formparser._line_parse(b"foo\r") == (b"foo", True)
+        assert formparser._line_parse(b"foo\n") == (b"foo", True)
 
     def test_find_terminator(self):
         lineiter = iter(b"\n\n\nfoo\nbar\nbaz".splitlines(True))
@@ -578,3 +850,41 @@ class TestInternalFunctions(object):
         assert list(lineiter) == [b"bar\n", b"baz"]
         assert find_terminator([]) == b""
         assert find_terminator([b""]) == b""
+
+    def test_compiled_helpers(self):
+        fast = pytest.importorskip("werkzeug._formparser_fast")
+        buffers = [
+            b"",
+            b"ab",
+            b"a\r",
+            b"a\rb\n",
+            b"\r\n\r\n",
+            b"x\r\n--foo \r\nz",
+            b"--foo--\r\n",
+            b"a\n--foo-",
+            b"\n--foox\r--foo",
+        ]
+        for buf in buffers + [bytearray(b) for b in buffers]:
+            for start in range(len(buf) + 2):
+                for stop in [None, len(buf) + 1, 4096] + list(range(len(buf) + 1)):
+                    for name in ("_find_line_end", "_find_last_line_break"):
+                        expected = getattr(formparser, "_py" + name)(buf, start, stop)
+                        assert getattr(fast, name)(buf, start, stop) == expected
+                    for at_line_start in (True, False):
+                        for eof in (True, False):
+                            args = (buf, b"--foo", start, stop, at_line_start, eof)
+                            expected = formparser._py_find_boundary(*args)
+                            assert fast._find_boundary(*args) == expected
+        for line in ("foo", "foo\r\n", "foo\r", b"foo\n", b"\r\n", b""):
+            assert fast._line_parse(line) == formparser._py_line_parse(line)
+
+    def test_buffer_pool(self):
+        buf = formparser._get_buffer(1024)
+        assert len(buf) >= 1024
+        formparser._put_buffer(buf)
+        assert formparser._get_buffer(1024) is buf
+        formparser._put_buffer(buf)
+        assert formparser._get_buffer(len(buf) + 1) is not buf
+        large = bytearray(formparser._max_pooled_buffer_size + 1)
+        formparser._put_buffer(large)
+        assert formparser._get_buffer(1024) is not large